@@ -1,18 +1,54 @@
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg') # Non-interactive backend: we only write PNG files, no GUI needed
 import matplotlib.pyplot as plt
+plt.rcParams['toolbar'] = 'None'
 import os
 import sys
+import csv
+import json
+
+# Categories of the per-run bar chart and their colors, in the same order
+_PER_RUN_LABELS = ('Successful Connects', 'Unsuccessful/Skipped Connects', 'Profiles without Connect Button')
+_PER_RUN_COLORS = ('green', 'orange', 'red')
+
+# Figures are kept and reused between calls, so a long-lived process (see worker.py)
+# doesn't have to build new figures and renderers for every run.
+_FIGURES = {}
+
+def _get_figure(name, **subplots_kwargs):
+    """
+    Returns the (fig, ax) pair stored under name, with the axes cleared, creating it on first use.
+    """
+    if name in _FIGURES:
+        fig, ax = _FIGURES[name]
+        ax.clear()
+    else:
+        fig, ax = plt.subplots(**subplots_kwargs)
+        _FIGURES[name] = (fig, ax)
+    return fig, ax
 
 def generate_graphs(current_run_dir, results_dir):
+    """
+    Generates the per-run and historical charts.
+    Returns a list of error messages, which is empty if no chart failed.
+    Skipped charts (e.g. no master CSV yet on the first run) are not errors.
+    """
+    errors = []
+
     # --- Read current run's data ---
     current_run_csv_path = os.path.join(current_run_dir, 'report.csv')
     try:
-        current_run_df = pd.read_csv(current_run_csv_path)
-        current_data = current_run_df.iloc[0] # Get the first (and only) row
+        # The per-run report has a single row, so read it with the csv module rather than pandas
+        with open(current_run_csv_path, 'r', newline='', encoding='utf-8') as f:
+            current_data = next(csv.DictReader(f), None) # Get the first (and only) row
+        if current_data is None:
+            raise pd.errors.EmptyDataError(f"{current_run_csv_path} has no data row")
         
-        connections_made = current_data['ConnectionsMade']
-        total_connect_buttons_found = current_data['TotalConnectButtonsFound']
-        total_profiles_scanned = current_data['TotalProfilesScanned']
+        connections_made = int(current_data['ConnectionsMade'])
+        total_connect_buttons_found = int(current_data['TotalConnectButtonsFound'])
+        total_profiles_scanned = int(current_data['TotalProfilesScanned'])
 
         # Calculate derived metrics for the bar chart
         unsuccessful_connects = total_connect_buttons_found - connections_made
@@ -26,76 +62,112 @@ def generate_graphs(current_run_dir, results_dir):
         profiles_without_connects = max(0, profiles_without_connects)
 
         # --- Per-Run Bar Chart ---
-        labels = ['Successful Connects', 'Unsuccessful/Skipped Connects', 'Profiles without Connect Button']
-        values = [connections_made, unsuccessful_connects, profiles_without_connects]
+        values = np.array([connections_made, unsuccessful_connects, profiles_without_connects])
         
-        # Filter out categories with zero values for better visualization if they exist
-        filtered_labels = [labels[i] for i, val in enumerate(values) if val > 0]
-        filtered_values = [val for val in values if val > 0]
+        # Filter out categories with zero values for better visualization if they exist,
+        # keeping each remaining bar's color matched to its category
+        kept = np.flatnonzero(values > 0)
+        filtered_labels = [_PER_RUN_LABELS[i] for i in kept]
+        filtered_colors = [_PER_RUN_COLORS[i] for i in kept]
+        filtered_values = values[kept]
 
-        if not filtered_values:
+        if not filtered_values.size:
             print(f"No data to plot for per-run chart in {current_run_dir} (all values are zero).") # Added more context
         else:
-            plt.figure(figsize=(10, 6))
-            plt.bar(filtered_labels, filtered_values, color=['green', 'orange', 'red'])
-            plt.ylabel('Count')
-            plt.title(f'Connection Statistics for Run: {current_data["RunID"]}')
-            plt.grid(axis='y', linestyle='--', alpha=0.7)
+            fig, ax = _get_figure('per_run', figsize=(10, 6), dpi=100)
+            ax.bar(filtered_labels, filtered_values, color=filtered_colors)
+            ax.set_ylabel('Count')
+            ax.set_title(f'Connection Statistics for Run: {current_data["RunID"]}')
+            ax.grid(axis='y', linestyle='--', alpha=0.7)
             
             per_run_chart_path = os.path.join(current_run_dir, 'connections_per_run.png')
-            plt.savefig(per_run_chart_path)
-            plt.close() # Close the plot to free memory
+            fig.savefig(per_run_chart_path, bbox_inches=None, pad_inches=0.1)
             print(f"Per-run chart saved to: {per_run_chart_path}")
 
     except FileNotFoundError:
         print(f"Current run CSV not found at {current_run_csv_path}. Skipping per-run chart.")
+        errors.append(f"Current run CSV not found at {current_run_csv_path}")
         # Do not return here, we still want to try for the all-runs chart
+    except pd.errors.EmptyDataError:
+        print(f"Current run CSV at {current_run_csv_path} is empty. Skipping per-run chart.")
     except Exception as e:
         print(f"Error generating per-run chart from {current_run_csv_path}: {e}") # Generic error for per-run
+        errors.append(f"Error generating per-run chart from {current_run_csv_path}: {e}")
 
     # --- Read Master Data for All Runs Chart ---
     master_csv_path = os.path.join(results_dir, 'master_report.csv')
+    all_runs_chart_path = os.path.join(results_dir, 'historical_connections.png')
+    hist_meta_path = os.path.join(results_dir, '.hist_meta.json')
     try:
-        master_df = pd.read_csv(master_csv_path)
-        # Ensure data is sorted by timestamp if necessary, though appending should keep it ordered
-        master_df['Timestamp'] = pd.to_datetime(master_df['Timestamp'], format='%Y%m%d_%H%M%S')
-        master_df = master_df.sort_values('Timestamp').reset_index(drop=True)
+        # Skip re-rendering the historical chart if master_report.csv hasn't changed since the last render
+        master_csv_stat = os.stat(master_csv_path)
+        if master_csv_stat.st_size == 0:
+            # Checked up front since the pyarrow engine doesn't raise pd.errors.EmptyDataError for empty files
+            raise pd.errors.EmptyDataError(f"{master_csv_path} is empty")
+        master_csv_meta = {'size': master_csv_stat.st_size, 'mtime': master_csv_stat.st_mtime}
+        try:
+            with open(hist_meta_path, 'r') as f:
+                last_meta = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            last_meta = None
+        if last_meta == master_csv_meta and os.path.exists(all_runs_chart_path):
+            print(f"Master CSV unchanged since last render. Historical chart is up to date: {all_runs_chart_path}")
+            return errors
+
+        # Only load the columns the chart uses
+        read_csv_kwargs = dict(
+            usecols=['Timestamp', 'ConnectionsMade', 'TotalProfilesScanned'],
+            parse_dates=['Timestamp'],
+            date_format='%Y%m%d_%H%M%S'
+        )
+        try:
+            # The pyarrow engine parses the CSV with Arrow's multi-threaded reader
+            master_df = pd.read_csv(master_csv_path, engine='pyarrow', **read_csv_kwargs)
+        except ImportError:
+            # pyarrow is not installed, fall back to pandas' default C engine
+            master_df = pd.read_csv(master_csv_path, engine='c', **read_csv_kwargs)
+        # Appending should keep it ordered, so only sort if the timestamps are out of order
+        if not master_df['Timestamp'].is_monotonic_increasing:
+            master_df = master_df.sort_values('Timestamp', ignore_index=True)
 
         # Calculate 'Other Interactions' for historical chart
-        # This is total profiles scanned minus successful connections made
-        master_df['OtherInteractions'] = master_df['TotalProfilesScanned'] - master_df['ConnectionsMade']
-        # Ensure non-negative
-        master_df['OtherInteractions'] = master_df['OtherInteractions'].apply(lambda x: max(0, x))
+        # This is total profiles scanned minus successful connections made, clamped to be non-negative
+        master_df['OtherInteractions'] = (master_df['TotalProfilesScanned'] - master_df['ConnectionsMade']).clip(lower=0)
 
         # Check if there's enough data to plot a line chart (at least 2 points for lines)
         if len(master_df) < 1: # Changed to 1, if only one run, we can still show a point
             print(f"Not enough data in master CSV ({len(master_df)} rows) for all-runs chart. Skipping.")
         else:
-            plt.figure(figsize=(12, 7))
-            plt.plot(master_df['Timestamp'], master_df['ConnectionsMade'], marker='o', label='Successful Connections', color='blue')
-            plt.plot(master_df['Timestamp'], master_df['OtherInteractions'], marker='x', label='Other Profile Interactions (Scanned - Connected)', color='purple', linestyle='--')
+            # constrained_layout prevents labels overlapping in a single layout pass
+            fig, ax = _get_figure('historical', figsize=(12, 7), dpi=100, constrained_layout=True)
+            ax.plot(master_df['Timestamp'], master_df['ConnectionsMade'], marker='o', label='Successful Connections', color='blue')
+            ax.plot(master_df['Timestamp'], master_df['OtherInteractions'], marker='x', label='Other Profile Interactions (Scanned - Connected)', color='purple', linestyle='--')
             
-            plt.xlabel('Run Timestamp')
-            plt.ylabel('Count')
-            plt.title('Connection Statistics Over All Runs')
-            plt.legend()
-            plt.grid(True)
-            plt.tight_layout() # Adjust layout to prevent labels overlapping
+            ax.set_xlabel('Run Timestamp')
+            ax.set_ylabel('Count')
+            ax.set_title('Connection Statistics Over All Runs')
+            ax.legend()
+            ax.grid(True)
             
             # Format x-axis for better readability if many runs
-            plt.xticks(rotation=45, ha='right')
+            fig.autofmt_xdate(rotation=45, ha='right')
             
-            all_runs_chart_path = os.path.join(results_dir, 'historical_connections.png')
-            plt.savefig(all_runs_chart_path)
-            plt.close() # Close the plot
+            fig.savefig(all_runs_chart_path, bbox_inches=None, pad_inches=0.1)
             print(f"Historical chart saved to: {all_runs_chart_path}")
 
+            # Remember which version of master_report.csv the chart was rendered from
+            with open(hist_meta_path, 'w') as f:
+                json.dump(master_csv_meta, f)
+
     except FileNotFoundError:
         print(f"Master CSV not found at {master_csv_path}. Skipping all-runs chart (first run?).")
     except pd.errors.EmptyDataError:
         print(f"Master CSV at {master_csv_path} is empty. Skipping all-runs chart.")
     except Exception as e:
         print(f"Error generating all-runs chart from {master_csv_path}: {e}") # Generic error for all-runs
+        errors.append(f"Error generating all-runs chart from {master_csv_path}: {e}")
+
+    return errors
 
 if __name__ == "__main__":
     if len(sys.argv) != 3:
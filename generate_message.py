@@ -1,36 +1,89 @@
 import sys
+import re
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from selectolax.lexbor import LexborHTMLParser
 import os # Import os to handle file paths
 
 # Configuration for Ollama API
 OLLAMA_API_URL = "http://localhost:11434/api/generate"
-MODEL_NAME = "llama3.1:8b-instruct-q4_K_S"
+# A 3B model is enough for extracting profile fields and writing a short message,
+# and runs about twice as fast as an 8B one in half the memory.
+# Set OLLAMA_MODEL to use a different model (e.g. "llama3.1:8b-instruct-q4_K_S" for higher quality).
+MODEL_NAME = os.environ.get("OLLAMA_MODEL", "llama3.2:3b-instruct-q4_K_M")
+OLLAMA_KEEP_ALIVE = "30m" # Keep the model loaded in memory between calls
+MAX_PROFILE_TEXT_CHARS = 20000 # Upper bound on profile text sent to the LLM
+OLLAMA_NUM_CTX = 8192 # Context window: fits MAX_PROFILE_TEXT_CHARS (~5000 tokens) plus the prompts and the output
+MAX_OUTPUT_TOKENS = 480 # A message under 200 characters (~80 tokens) plus a summary of at most 150 words (~250 tokens), with headroom
 
-def call_ollama(prompt, system_message="", response_format=None):
+# Reuse one HTTP session for all Ollama calls so the TCP connection is kept alive
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+# The system prompt is constant (the person's name goes in the user prompt) so that
+# Ollama can reuse the cached prefix of the prompt across requests while the model stays loaded.
+_EXTRACT_AND_MESSAGE_SYSTEM = """You are an AI assistant that reads the text content of a LinkedIn profile page and writes a LinkedIn connection request message.
+First, extract a summary of key professional information:
+- User's Name
+- Current Job Title and Company
+- Previous Job Titles and Companies
+- Education (Degrees, Universities)
+- Key Skills/Expertise
+- Any notable achievements or projects (briefly)
+- Industries they have worked in
+- Location
+The summary should be concise and readable, using bullet points for lists, and at most 150 words.
+Do NOT include any personal opinions, greetings, or conversational filler in the summary.
+If information is not present, omit that section.
+
+Then, based on that summary, write a polite and concise connection message. The message should be:
+- Personalized using the person's name given in the request.
+- Professional and to the point (max 2-3 sentences).
+- Briefly mention a commonality or reason for connecting based on the extracted info (e.g., shared industry, interesting role, common skill).
+- End with a polite closing.
+- Do NOT include any greetings like "Hello" or "Hi [Name]", just start with the message content directly.
+- Do NOT include your own name or signature.
+- Ensure the message is under 200 characters, as LinkedIn connection notes have a character limit.
+
+Respond ONLY with a JSON object of the form {"message": "...", "summary": "..."}, with "message" first.
+"""
+
+def _build_payload(prompt, system_message="", response_format=None, stream=False, max_tokens=None):
     """
-    Calls the Ollama API to generate text based on the given prompt and system message.
+    Builds the request payload for the Ollama generate API.
     """
-    headers = {"Content-Type": "application/json"}
     payload = {
         "model": MODEL_NAME,
         "prompt": prompt,
-        "stream": False,  # We want the full response at once
+        "stream": stream,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
         "options": {
             "temperature": 0.7, # Controls randomness. Lower is more deterministic.
             "top_k": 40,        # Limits the vocabulary to the top_k most likely tokens.
-            "top_p": 0.9        # Nucleus sampling: picks from the smallest set of tokens whose cumulative probability exceeds top_p.
+            "top_p": 0.9,       # Nucleus sampling: picks from the smallest set of tokens whose cumulative probability exceeds top_p.
+            "num_ctx": OLLAMA_NUM_CTX # Size of the context window (and KV cache) to allocate.
         }
     }
+    if max_tokens:
+        payload["options"]["num_predict"] = max_tokens # Caps the number of generated tokens.
     if system_message:
         payload["system"] = system_message
     if response_format:
         payload["format"] = response_format
+    return payload
 
+def _post_ollama(payload, read_response, stream=False):
+    """
+    Posts the payload to the Ollama API and returns read_response(response).
+    Errors are reported on stderr and None is returned.
+    """
+    headers = {"Content-Type": "application/json"}
     try:
-        response = requests.post(OLLAMA_API_URL, headers=headers, json=payload, timeout=600) # Added timeout
-        response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-        return response.json()['response']
+        with _SESSION.post(OLLAMA_API_URL, headers=headers, json=payload, timeout=600, stream=stream) as response: # Added timeout
+            response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
+            return read_response(response)
     except requests.exceptions.Timeout:
         print(f"Error: Ollama API call timed out after 600 seconds.", file=sys.stderr)
         return None
@@ -44,79 +97,224 @@ def call_ollama(prompt, system_message="", response_format=None):
         print(f"Error: 'response' key not found in Ollama API response.", file=sys.stderr)
         return None
 
-def extract_profile_info(html_content):
+def _warn_if_truncated(data):
+    """
+    Reports on stderr when generation stopped because it reached the num_predict limit.
+    """
+    if data.get('done_reason') == 'length':
+        print("Warning: Ollama output was cut off at the num_predict token limit; the response is incomplete.", file=sys.stderr)
+
+def call_ollama(prompt, system_message="", response_format=None, max_tokens=None):
     """
-    Uses Ollama to extract key professional information from LinkedIn profile HTML.
+    Calls the Ollama API to generate text based on the given prompt and system message.
+    """
+    payload = _build_payload(prompt, system_message, response_format, stream=False, max_tokens=max_tokens) # We want the full response at once
+    def read_response(response):
+        data = response.json()
+        _warn_if_truncated(data)
+        return data['response']
+
+    return _post_ollama(payload, read_response)
+
+def call_ollama_stream(prompt, system_message="", response_format=None, on_token=None, max_tokens=None):
+    """
+    Calls the Ollama API with streaming enabled, passing each response chunk to on_token as it arrives.
+    Returns the full concatenated response once generation is done.
     """
-    extraction_system_message = """You are an AI assistant that extracts key professional information from raw HTML content of a LinkedIn profile.
-    Focus on extracting:
-    - User's Name
-    - Current Job Title and Company
-    - Previous Job Titles and Companies
-    - Education (Degrees, Universities)
-    - Key Skills/Expertise
-    - Any notable achievements or projects (briefly)
-    - Industries they have worked in
-    - Location
+    payload = _build_payload(prompt, system_message, response_format, stream=True, max_tokens=max_tokens)
+
+    def read_stream(response):
+        chunks = []
+        for line in response.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            token = data['response']
+            chunks.append(token)
+            if on_token:
+                on_token(token)
+            if data.get('done'):
+                _warn_if_truncated(data)
+                break
+        return "".join(chunks)
 
-    Format the output as a concise, readable summary, using bullet points for lists.
-    Do NOT include any personal opinions, greetings, or conversational filler.
-    If information is not present, omit that section.
+    return _post_ollama(payload, read_stream, stream=True)
+
+class JsonStringFieldStreamer:
+    """
+    Incrementally decodes one string field out of a JSON object that is being streamed,
+    writing the field's characters to `out` as soon as they are generated.
     """
-    # Truncate HTML to avoid exceeding token limits for the LLM, if necessary.
-    # A full LinkedIn profile HTML can be very large. You might need to adjust this.
-    # For now, let's pass the whole thing, but keep this in mind for very large profiles.
-    extraction_prompt = f"Extract professional information from the following LinkedIn profile HTML:\n\n{html_content}"
-    return call_ollama(extraction_prompt, system_message=extraction_system_message)
+    def __init__(self, field, out):
+        self.out = out
+        self.start_pattern = re.compile(r'(?<!\\)"' + re.escape(field) + r'"\s*:\s*"')
+        self.buffer = ""
+        self.pos = None # Position in buffer of the next undecoded character of the field value
+        self.done = False
+
+    def feed(self, chunk):
+        if self.done:
+            return
+        self.buffer += chunk
+        if self.pos is None:
+            match = self.start_pattern.search(self.buffer)
+            if not match:
+                return
+            self.pos = match.end()
 
-def generate_connection_message(extracted_info, person_name):
+        decoded = []
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            if char == '"':
+                self.done = True
+                break
+            if char == '\\':
+                escape_len = 6 if self.buffer[self.pos + 1:self.pos + 2] == 'u' else 2
+                escape = self.buffer[self.pos:self.pos + escape_len]
+                if len(escape) < escape_len:
+                    break # Wait for the rest of the escape sequence
+                if escape_len == 6 and 0xD800 <= int(escape[2:], 16) <= 0xDBFF:
+                    # A high surrogate must be decoded together with the low surrogate escape after it
+                    next_escape = self.buffer[self.pos + 6:self.pos + 12]
+                    if len(next_escape) < 6 and '\\u'.startswith(next_escape[:2]):
+                        break # Wait for the second half of the surrogate pair
+                    if next_escape.startswith('\\u'):
+                        escape += next_escape
+                        escape_len = 12
+                text = json.loads(f'"{escape}"')
+                if len(text) == 1 and 0xD800 <= ord(text) <= 0xDFFF:
+                    text = '\ufffd' # A surrogate without its other half can't be written out
+                decoded.append(text)
+                self.pos += escape_len
+            else:
+                decoded.append(char)
+                self.pos += 1
+        if decoded:
+            self.out.write("".join(decoded))
+            self.out.flush()
+
+def html_to_text(html_content):
+    """
+    Strips scripts, styles and other markup from LinkedIn profile HTML and returns its visible text.
+    Prefers the <main> region of the page, falling back to <body>.
     """
-    Uses Ollama to generate a personalized LinkedIn connection message.
+    tree = LexborHTMLParser(html_content)
+    for tag in tree.css('script, style, noscript, svg'):
+        tag.decompose()
+    root = tree.css_first('main') or tree.body
+    if root is None:
+        return ""
+    return root.text(separator=' ', strip=True)[:MAX_PROFILE_TEXT_CHARS]
+
+def build_prompt(html_content, person_name):
     """
-    message_system_message = f"""You are an AI assistant that generates a polite and concise LinkedIn connection request message based on extracted professional information.
-    The message should be:
-    - Personalized using the person's name ({person_name}).
-    - Professional and to the point (max 2-3 sentences).
-    - Briefly mention a commonality or reason for connecting based on the extracted info (e.g., shared industry, interesting role, common skill).
-    - End with a polite closing.
-    - Do NOT include any greetings like "Hello" or "Hi [Name]", just start with the message content directly.
-    - Do NOT include your own name or signature.
-    - Ensure the message is under 200 characters, as LinkedIn connection notes have a character limit.
+    Builds the user prompt for a profile. The static instruction comes first so that, together with
+    the constant system prompt, every request starts with the same prefix that Ollama can cache.
     """
-    message_prompt = f"Generate a LinkedIn connection message for {person_name} based on their profile summary:\n\n{extracted_info}"
-    return call_ollama(message_prompt, system_message=message_system_message)
+    # A full LinkedIn profile HTML can be very large and is mostly markup.
+    # Send only the visible text, truncated to MAX_PROFILE_TEXT_CHARS, to keep the prompt small.
+    profile_text = html_to_text(html_content)
+    return f"Extract professional information and generate a LinkedIn connection message from the LinkedIn profile text below. Address the message to {person_name}.\n\n{profile_text}"
+
+def extract_and_message(html_content, person_name, stream_to=None):
+    """
+    Uses a single Ollama call to extract key professional information from LinkedIn profile HTML
+    and generate a personalized connection message from it.
+    If stream_to is given, the message is written to it token by token while it is being generated,
+    so on failure stream_to may already hold part of the message.
+    Returns a dict with "summary" and "message" keys, or None on failure.
+    """
+    prompt = build_prompt(html_content, person_name)
+    if stream_to is not None:
+        streamer = JsonStringFieldStreamer("message", stream_to)
+        response = call_ollama_stream(prompt, system_message=_EXTRACT_AND_MESSAGE_SYSTEM, response_format="json", on_token=streamer.feed, max_tokens=MAX_OUTPUT_TOKENS)
+    else:
+        response = call_ollama(prompt, system_message=_EXTRACT_AND_MESSAGE_SYSTEM, response_format="json", max_tokens=MAX_OUTPUT_TOKENS)
+    if not response:
+        return None
+
+    try:
+        result = json.loads(response)
+    except json.JSONDecodeError:
+        print("Error: LLM response was not valid JSON.", file=sys.stderr)
+        return None
+    if not isinstance(result, dict) or not result.get("message"):
+        print("Error: 'message' key not found in LLM JSON response.", file=sys.stderr)
+        return None
+    if stream_to is not None and streamer.pos is None:
+        # The message field was never detected while streaming, so write it out in full
+        stream_to.write(result["message"])
+        stream_to.flush()
+    return result
+
+def read_profile_html(profile_html_path):
+    """
+    Reads the saved LinkedIn profile HTML file as raw bytes, which selectolax parses directly,
+    so the HTML is never decoded into a Python str.
+    """
+    if not os.path.exists(profile_html_path):
+        raise FileNotFoundError(f"HTML file not found at {profile_html_path}")
+
+    with open(profile_html_path, 'rb') as f:
+        return f.read()
+
+def run_batch(input_stream, output_stream):
+    """
+    Processes many profiles in one process. Reads one JSON request per line from input_stream,
+    of the form {"html_path": "...", "name": "..."}, and writes one JSON result per line to output_stream,
+    of the form {"name": "...", "message": "..."} or {"name": "...", "message": null, "error": "..."}.
+    """
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+
+        person_name = None
+        try:
+            request = json.loads(line)
+            person_name = request["name"]
+            html_content = read_profile_html(request["html_path"])
+            result = extract_and_message(html_content, person_name)
+            if result:
+                output = {"name": person_name, "message": result["message"]}
+            else:
+                output = {"name": person_name, "message": None, "error": "Failed to generate connection message from LLM."}
+        except Exception as e:
+            print(f"Error processing batch request {line!r}: {e}", file=sys.stderr)
+            output = {"name": person_name, "message": None, "error": str(e)}
+
+        output_stream.write(json.dumps(output) + "\n")
+        output_stream.flush() # Let the caller read each result as soon as it is ready
 
 if __name__ == "__main__":
-    # The script expects two command-line arguments:
+    # Batch mode: python generate_message.py --batch < requests.jsonl
+    # Keeps one interpreter and HTTP session alive across many profiles.
+    if "--batch" in sys.argv[1:]:
+        run_batch(sys.stdin, sys.stdout)
+        sys.exit(0)
+
+    # Otherwise the script expects two command-line arguments:
     # 1. Path to the temporary HTML file containing the profile content.
     # 2. The name of the person from the search result.
+    # The message is streamed to stdout while it is generated, so if the script exits with a
+    # non-zero code, stdout may hold a partial message and callers must ignore it.
     if len(sys.argv) < 3:
         print("Usage: python generate_message.py <profile_html_path> <person_name>", file=sys.stderr)
+        print("       python generate_message.py --batch < requests.jsonl", file=sys.stderr)
         sys.exit(1)
 
     profile_html_path = sys.argv[1]
     person_name = sys.argv[2]
 
     try:
-        if not os.path.exists(profile_html_path):
-            raise FileNotFoundError(f"HTML file not found at {profile_html_path}")
-
-        with open(profile_html_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
+        html_content = read_profile_html(profile_html_path)
 
-        # First LLM call: extract information
-        extracted_info = extract_profile_info(html_content)
-        if not extracted_info:
-            print("Failed to extract profile information from LLM.", file=sys.stderr)
-            sys.exit(1)
-
-        # Second LLM call: generate connection message
-        connection_message = generate_connection_message(extracted_info, person_name)
-        if connection_message:
-            # Print the generated message to stdout for Node.js to capture
-            print(connection_message)
-        else:
-            print("Failed to generate connection message from LLM.", file=sys.stderr)
+        # Single LLM call: extract information and generate connection message
+        # The message is streamed to stdout for Node.js to capture as it is generated
+        result = extract_and_message(html_content, person_name, stream_to=sys.stdout)
+        print() # End the streamed message (or any partial output) with a newline
+        if not result:
+            print("Failed to generate connection message from LLM. Any output on stdout is incomplete and should be ignored.", file=sys.stderr)
             sys.exit(1)
 
     except FileNotFoundError as fnf_e:
@@ -125,4 +323,3 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"An unexpected error occurred: {e}", file=sys.stderr)
         sys.exit(1)
-
@@ -0,0 +1,68 @@
+import sys
+import json
+import contextlib
+
+from generate_graphs import generate_graphs
+from generate_message import read_profile_html, extract_and_message
+
+# Long-lived worker that keeps pandas, matplotlib and the Ollama HTTP session loaded
+# across requests, instead of starting a new Python process for every run or profile.
+#
+# Reads one JSON request per line from stdin and writes one JSON response per line to stdout:
+#   {"command": "generate_graphs", "current_run_dir": "...", "results_dir": "..."}
+#   {"command": "generate_message", "html_path": "...", "name": "..."}
+# Responses are {"id": ..., "ok": true, "result": ...} or {"id": ..., "ok": false, "error": "..."},
+# where "id" is copied from the request if it has one.
+
+def handle_generate_graphs(request):
+    errors = generate_graphs(request["current_run_dir"], request["results_dir"])
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    return None
+
+def handle_generate_message(request):
+    html_content = read_profile_html(request["html_path"])
+    result = extract_and_message(html_content, request["name"])
+    if not result:
+        raise RuntimeError("Failed to generate connection message from LLM.")
+    return {"message": result["message"]}
+
+HANDLERS = {
+    "generate_graphs": handle_generate_graphs,
+    "generate_message": handle_generate_message,
+}
+
+def dispatch(request):
+    """
+    Runs the handler for the request's command and returns the JSON response.
+    """
+    command = request.get("command")
+    handler = HANDLERS.get(command)
+    if handler is None:
+        return {"ok": False, "error": f"Unknown command: {command}"}
+    # Progress messages printed by the handlers go to stderr so stdout only carries responses
+    with contextlib.redirect_stdout(sys.stderr):
+        result = handler(request)
+    return {"ok": True, "result": result}
+
+def main():
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            response = dispatch(request)
+        except Exception as e:
+            print(f"Error handling worker request {line!r}: {e}", file=sys.stderr)
+            response = {"ok": False, "error": str(e)}
+
+        response["id"] = request_id
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush() # Let the caller read each response as soon as it is ready
+
+if __name__ == "__main__":
+    main()